@@ -4,5 +4,7 @@
 #--param OLLAMA_API_SECRET "$OLLAMA_API_SECRET"
 
 import chat
+chat.prewarm()
+
 def main(args):
   return { "body": chat.chat(args) }
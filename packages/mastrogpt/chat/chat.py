@@ -1,8 +1,36 @@
 import os
+import re
+import bisect
+import functools
 import json
-import time
+import logging
 import socket
+import time
+import types
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# orjson is much faster on the streaming path, plain json is the fallback
+def _json_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps_str = orjson.dumps
+    def _dumps(obj) -> bytes:
+        try:
+            return orjson.dumps(obj)
+        except orjson.JSONEncodeError:
+            # the state comes from the client and may hold values orjson
+            # rejects, such as integers beyond 64 bits
+            return _json_dumps(obj)
+except ImportError:
+    _loads = json.loads
+    _dumps = _dumps_str = _json_dumps
 
 # ------------------------------------------------------------------ #
 # CONFIGURATION – edit only these lines                              #
@@ -21,10 +49,70 @@ STATIC_MODELS = [
     "openai/gpt-oss-120b:free"
 ]
 STREAM_ENABLED = True        # False → blocking / non-streaming
+API_URL = "https://openrouter.ai/api/v1/chat/completions"
+API_TIMEOUT = (5, 60)        # seconds: connect, wait between stream chunks
+MAX_HISTORY_TURNS = 20       # user+assistant pairs sent to the model
+MAX_HISTORY_TOKENS = 8192    # estimated as 4 characters per token
 
 # ------------------------------------------------------------------ #
 # INTERNAL HELPERS                                                   #
 # ------------------------------------------------------------------ #
+# model lookup tables, built once at import
+_MODELS_BY_LOWER = {m.lower(): m for m in STATIC_MODELS}
+_MODELS_LOWER_SORTED = sorted(_MODELS_BY_LOWER)
+_MODEL_LIST_STR = "Available models:\n" + "\n".join(STATIC_MODELS) + "\n\nCurrent model: "
+
+def _match_models(prefix: str) -> list:
+    """
+    Returns the models matching the lowercase prefix:
+    an exact match alone, otherwise every model starting with it.
+    """
+    exact = _MODELS_BY_LOWER.get(prefix)
+    if exact:
+        return [exact]
+    found = []
+    i = bisect.bisect_left(_MODELS_LOWER_SORTED, prefix)
+    while i < len(_MODELS_LOWER_SORTED) and _MODELS_LOWER_SORTED[i].startswith(prefix):
+        found.append(_MODELS_BY_LOWER[_MODELS_LOWER_SORTED[i]])
+        i += 1
+    return found
+
+# kept across invocations of a warm action, so the TLS connection is reused
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+def _prewarm():
+    """
+    Opens the connection to the API host in advance,
+    so the first request does not pay the TCP + TLS handshake.
+    """
+    try:
+        _SESSION.head(API_URL, timeout=5)
+    except Exception:
+        pass
+
+_PREWARM = None
+_PREWARM_WAIT = 2  # seconds an API call waits for the pre-warm request
+
+def prewarm():
+    """
+    Starts the pre-warm request in the background, once per process.
+    Called by the action entry point, not on import of this module.
+    """
+    global _PREWARM
+    if _PREWARM is None:
+        _PREWARM = threading.Thread(target=_prewarm, daemon=True)
+        _PREWARM.start()
+
+def _session() -> requests.Session:
+    """
+    Returns the shared session, after waiting a bounded time for the
+    pre-warm request, so the first call can reuse its connection.
+    """
+    if _PREWARM is not None:
+        _PREWARM.join(timeout=_PREWARM_WAIT)
+    return _SESSION
+
 def _get_base_url(args: dict) -> str:
     """
     Returns the base URL (with no trailing slash).
@@ -33,24 +121,139 @@ def _get_base_url(args: dict) -> str:
     base = args.get("OLLAMA_API_HOST", os.getenv("OLLAMA_API_HOST", ""))
     return base.rstrip("/") if base else ""
 
-def _get_headers(args: dict) -> dict:
-    token = args.get("OLLAMA_API_SECRET", os.getenv("OLLAMA_API_SECRET", ""))
-    hdr = {"Content-Type": "application/json"}
-    if token:
-        hdr["Authorization"] = f"Bearer {token}"
-    return hdr
+_BASE_HEADERS = {
+    "Content-Type": "application/json",
+    "HTTP-Referer": "http://devel.ops.knuth.li",
+    "X-Title": "AI Chat",
+}
+
+@functools.lru_cache(maxsize=8)
+def _headers_for(token: str) -> types.MappingProxyType:
+    """
+    Builds the headers for a token, read-only since they are shared.
+    """
+    if not token:
+        return types.MappingProxyType(dict(_BASE_HEADERS))
+    return types.MappingProxyType({**_BASE_HEADERS, "Authorization": f"Bearer {token}"})
+
+def _get_headers(args: dict) -> types.MappingProxyType:
+    """
+    Returns the request headers, cached per token.
+    """
+    token = args.get("OLLAMA_API_SECRET")
+    if token is None:
+        token = os.getenv("OLLAMA_API_SECRET", "")
+    return _headers_for(token)
+
+# matches choices[0].delta.content in an OpenRouter stream frame
+_DELTA_RE = re.compile(rb'"delta"\s*:\s*\{[^}]*"content"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+def _delta_content(payload: bytes):
+    """
+    Returns the delta content of a stream frame, or None if it has none.
+    The content string alone is decoded when possible,
+    falling back to parsing the whole frame.
+    """
+    m = _DELTA_RE.search(payload)
+    if m:
+        return _loads(b'"' + m.group(1) + b'"')
+    data_obj = _loads(payload)
+    if 'choices' in data_obj and len(data_obj['choices']) > 0:
+        return data_obj['choices'][0].get('delta', {}).get('content')
+    return None
+
+def _trim_history(messages: list) -> list:
+    """
+    Keeps the most recent messages within MAX_HISTORY_TURNS and
+    MAX_HISTORY_TOKENS, dropping the oldest ones.
+    A leading system message is always kept, as is the last message,
+    and the kept window starts with a user message.
+    """
+    head = messages[:1] if messages and messages[0].get("role") == "system" else []
+    budget = MAX_HISTORY_TOKENS - sum(len(m.get("content") or "") // 4 for m in head)
+    # the stored pairs plus the new user message
+    limit = MAX_HISTORY_TURNS * 2 + 1
+    start = len(messages)
+    while start > len(head) and len(messages) - start < limit:
+        cost = len(messages[start - 1].get("content") or "") // 4
+        if cost > budget and start < len(messages):
+            break
+        budget -= cost
+        start -= 1
+    # open on a user turn: some models reject a leading assistant message
+    while start < len(messages) - 1 and messages[start].get("role") != "user":
+        start += 1
+    if start == len(head):
+        return messages
+    return head + messages[start:]
 
 # ------------------------------------------------------------------ #
 # SOCKET HELPERS                                                     #
 # ------------------------------------------------------------------ #
+class _SockWriter:
+    """
+    Buffers small writes to the stream socket and flushes them in batches.
+    A write flushes the buffer when it reaches flush_every bytes, or when
+    its oldest byte is older than flush_every_ms milliseconds; nothing is
+    flushed between writes, so callers must flush() before blocking
+    (e.g. on the network), and close() flushes what is left.
+    Pending frames are written with a single sendmsg, without joining them.
+    """
+    MAX_PARTS = 512  # stay well below IOV_MAX
+
+    def __init__(self, sock, flush_every: int = 4096, flush_every_ms: int = 5):
+        self.sock = sock
+        self.flush_every = flush_every
+        self.flush_every_ms = flush_every_ms
+        self.parts = []
+        self.size = 0
+        self.since = 0.0
+
+    def sendall(self, data: bytes):
+        if not self.parts:
+            self.since = time.monotonic()
+        self.parts.append(data)
+        self.size += len(data)
+        if (self.size >= self.flush_every or len(self.parts) >= self.MAX_PARTS or
+                (time.monotonic() - self.since) * 1000 >= self.flush_every_ms):
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        if len(self.parts) == 1:
+            self.sock.sendall(self.parts[0])
+        else:
+            sent = self.sock.sendmsg(self.parts)
+            if sent < self.size:
+                self.sock.sendall(b"".join(self.parts)[sent:])
+        self.parts = []
+        self.size = 0
+
+    def close(self):
+        try:
+            self.flush()
+        finally:
+            self.sock.close()
+
 def _open_socket(args: dict):
     host = args.get("STREAM_HOST", "").strip()
     port = int(args.get("STREAM_PORT", "0"))
     if not host or port == 0:
         return None
     s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    # room for a whole reply, so sendall does not block on a slow reader
+    s.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 256 * 1024)
     s.connect((host, port))
-    return s
+    # tokens are tiny writes: flush each one instead of waiting on Nagle
+    s.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    if hasattr(socket, "TCP_QUICKACK"):
+        s.setsockopt(socket.IPPROTO_TCP, socket.TCP_QUICKACK, 1)
+    try:
+        s.setsockopt(socket.IPPROTO_IP, socket.IP_TOS, 0x10)  # IPTOS_LOWDELAY
+    except OSError:
+        pass
+    return _SockWriter(s)
 
 def _close_socket(sock):
     try:
@@ -58,15 +261,31 @@ def _close_socket(sock):
     except Exception:
         pass
 
+def _encode(payload: dict) -> bytes:
+    return _dumps(payload) + b"\n"
+
 def _send(sock, payload: dict):
     if sock is None:
         return
-    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    sock.sendall(data)
+    sock.sendall(_encode(payload))
+
+# framing of an output message, so only the text itself is encoded
+_OUT_PREFIX = b'{"output":"'
+_OUT_SUFFIX = b'"}\n'
+
+def _encode_output(text: str) -> bytes:
+    # the encoded string without its surrounding quotes
+    return _OUT_PREFIX + _dumps_str(text)[1:-1] + _OUT_SUFFIX
+
+def _send_output(sock, text: str):
+    if sock is None:
+        return
+    sock.sendall(_encode_output(text))
 
-def _stream_text(sock, text: str, chunk_size: int = 10):
+def _stream_text(sock, text: str, chunk_size: int = 4096, state: dict = None):
     """
-    Helper to stream text through socket in chunks
+    Helper to stream text through socket in chunks.
+    If state is given it is sent in the same write as the first chunk.
     """
     if sock is None:
         return
@@ -75,10 +294,98 @@ def _stream_text(sock, text: str, chunk_size: int = 10):
     if isinstance(text, bytes):
         text = text.decode('utf-8', errors='replace')
     
+    head = _encode({"state": state}) if state is not None else b""
     for i in range(0, len(text), chunk_size):
         chunk = text[i:i+chunk_size]
-        _send(sock, {"output": chunk})
-        time.sleep(0.01)  # Small delay to simulate streaming
+        sock.sendall(head + _encode_output(chunk))
+        head = b""
+    if head:
+        sock.sendall(head)
+
+class _LineSplitter:
+    """
+    Splits a stream of byte chunks into lines (without the line ending).
+    Only the newly received bytes are scanned for a newline, so the cost is
+    linear in the response size.
+    """
+    def __init__(self):
+        self.buf = bytearray()
+
+    def feed(self, chunk: bytes) -> list:
+        """
+        Adds a chunk and returns the lines it completes.
+        """
+        buf = self.buf
+        scan = len(buf)
+        buf += chunk
+        lines = []
+        start = 0
+        view = memoryview(buf)
+        while True:
+            end = buf.find(b"\n", scan)
+            if end < 0:
+                break
+            lines.append(bytes(view[start:end]).rstrip(b"\r"))
+            start = scan = end + 1
+        view.release()
+        del buf[:start]
+        return lines
+
+
+def _stream_completion(sock, url: str, headers: dict, data: dict) -> str:
+    """
+    Sends the request in streaming mode, relays each delta to sock
+    and returns the full text of the reply.
+    """
+    parts = []
+    # Use proper SSE streaming implementation per OpenRouter docs
+    with _session().post(url, headers=headers, json=data, stream=True, timeout=API_TIMEOUT) as response:
+        logger.debug("POST %s model=%s msgs=%d", url, data["model"], len(data["messages"]))
+        response.raise_for_status()
+        
+        chunks = response.iter_content(chunk_size=8192, decode_unicode=False)
+        splitter = _LineSplitter()
+        done = False
+        for chunk in chunks:
+            for line in splitter.feed(chunk):
+                # Handle Server-Sent Events format
+                if line.startswith(b'data: '):
+                    data_str = line[6:]
+                    if data_str == b'[DONE]':
+                        done = True
+                        break
+                    
+                    try:
+                        content = _delta_content(data_str)
+                        if content:
+                            parts.append(content)
+                            _send_output(sock, content)
+                    except json.JSONDecodeError:
+                        # Handle incomplete JSON chunks 
+                        continue
+            # the lines of this chunk are relayed: flush them
+            # before waiting on the network again
+            if sock is not None:
+                sock.flush()
+            if done:
+                break
+        full_text = "".join(parts)
+        if done:
+            _drain(response, chunks)
+    return full_text
+
+def _drain(response, chunks, timeout: float = 0.2):
+    """
+    Best effort read of what follows [DONE], so the connection can go
+    back to the pool instead of being closed. Gives up, and lets the
+    connection be closed, if the body does not end within timeout.
+    """
+    try:
+        response.raw.connection.sock.settimeout(timeout)
+        for _ in chunks:
+            pass
+    except Exception:
+        pass
 
 
 # ------------------------------------------------------------------ #
@@ -94,8 +401,14 @@ def chat(args: dict) -> dict:
             state_payload = json.loads(state_input)
         except json.JSONDecodeError:
             state_payload = {}
+    elif isinstance(state_input, dict):
+        # args are parsed anew for each activation and the state is returned,
+        # so the dict can be updated in place
+        state_payload = state_input
     else:
-        state_payload = state_input.copy() if isinstance(state_input, dict) else {}
+        state_payload = {}
+    if not isinstance(state_payload, dict):
+        state_payload = {}
     
     # Ensure state has required fields
     if "model" not in state_payload:
@@ -120,26 +433,23 @@ def chat(args: dict) -> dict:
         
         if user_inp == '@':
             # List available models
-            model_list = "\n".join(STATIC_MODELS)
-            output = f"Available models:\n{model_list}\n\nCurrent model: {state_payload['model']}"
+            output = f"{_MODEL_LIST_STR}{state_payload['model']}"
             
             if STREAM_ENABLED:
-                _send(sock, {"state": state_payload})
-                _stream_text(sock, output)
+                _stream_text(sock, output, state=state_payload)
                 _close_socket(sock)
             
             return {"output": output, "streaming": STREAM_ENABLED, "state": state_payload}
         else:
             # Try to match model prefix
             prefix = user_inp[1:].lower()
-            matched_models = [model for model in STATIC_MODELS if model.lower() == prefix]
+            matched_models = _match_models(prefix)
             
             if not matched_models:
                 output = f"No model found with prefix '{prefix}'. Current model remains: {state_payload['model']}"
                 
                 if STREAM_ENABLED:
-                    _send(sock, {"state": state_payload})
-                    _stream_text(sock, output)
+                    _stream_text(sock, output, state=state_payload)
                     _close_socket(sock)
                 
                 return {"output": output, "streaming": STREAM_ENABLED, "state": state_payload}
@@ -148,8 +458,7 @@ def chat(args: dict) -> dict:
                 output = f"Multiple models match prefix '{prefix}':\n" + "\n".join(matched_models)
                 
                 if STREAM_ENABLED:
-                    _send(sock, {"state": state_payload})
-                    _stream_text(sock, output)
+                    _stream_text(sock, output, state=state_payload)
                     _close_socket(sock)
                 
                 return {"output": output, "streaming": STREAM_ENABLED, "state": state_payload}
@@ -159,21 +468,18 @@ def chat(args: dict) -> dict:
             output = f"Model updated to: {matched_models[0]}"
             
             if STREAM_ENABLED:
-                _send(sock, {"state": state_payload})
-                _stream_text(sock, output)
+                _stream_text(sock, output, state=state_payload)
                 _close_socket(sock)
             
             return {"output": output, "streaming": STREAM_ENABLED, "state": state_payload}
 
     # Handle normal input - prepare messages history
-    messages = state_payload["history"].copy()
-    messages.append({"role": "user", "content": user_inp})
+    # a single new list: the stored history is left untouched if the call fails
+    messages = _trim_history(state_payload["history"] + [{"role": "user", "content": user_inp}])
 
     # Prepare API request
-    url = "https://openrouter.ai/api/v1/chat/completions"
+    url = API_URL
     headers = _get_headers(args)
-    headers["HTTP-Referer"] = "http://devel.ops.knuth.li"
-    headers["X-Title"] = "AI Chat"
     print(f"Model used is {state_payload['model']}")
     data = {
         "model": state_payload["model"],
@@ -186,33 +492,7 @@ def chat(args: dict) -> dict:
     _send(sock, {"state": state_payload})
     try:
         if STREAM_ENABLED:
-            # Use proper SSE streaming implementation per OpenRouter docs
-            with requests.post(url, headers=headers, json=data, stream=True) as response:
-                print(f"Open API call ({url}, {headers}, {data}) sent, response in streamed")
-                response.raise_for_status()
-                
-                # Set encoding explicitly to UTF-8
-                response.encoding = 'utf-8'
-                
-                for line in response.iter_lines(decode_unicode=True):
-                    if line:
-                        # Handle Server-Sent Events format
-                        if line.startswith('data: '):
-                            data_str = line[6:]
-                            if data_str == '[DONE]':
-                                break
-                            
-                            try:
-                                data_obj = json.loads(data_str)
-                                if 'choices' in data_obj and len(data_obj['choices']) > 0:
-                                    delta = data_obj['choices'][0].get('delta', {})
-                                    if 'content' in delta:
-                                        content = delta['content']
-                                        full_text += content
-                                        _send(sock, {"output": content})
-                            except json.JSONDecodeError:
-                                # Handle incomplete JSON chunks 
-                                continue
+            full_text = _stream_completion(sock, url, headers, data)
 
             # Update history
             messages.append({"role": "assistant", "content": full_text})
@@ -220,7 +500,7 @@ def chat(args: dict) -> dict:
             
         else:
             # Non-streaming request
-            response = requests.post(url, headers=headers, json=data)
+            response = _session().post(url, headers=headers, json=data)
             response.raise_for_status()
             result = response.json()
             